@@ -22,9 +22,11 @@
 
 import casadi as cs
 import os
+import sys
 from casadi import *
 from collections import defaultdict, OrderedDict
 from contextlib import contextmanager
+from functools import lru_cache
 
 def get_ranges_dict(list_expr):
     ret = HashDict()
@@ -102,14 +104,17 @@ def reinterpret_expr(expr, symbols_from, symbols_to):
     return output_val[0]
 
 
+@lru_cache(maxsize=None)
+def _source_path(filename):
+    # Resolved once per source file: get_meta runs for every declared symbol and constraint
+    return os.path.abspath(filename)
+
 def get_meta(base=None):
     if base is not None: return base
     # Construct meta-data
-    import sys
-    import os
     try:
         frame = sys._getframe(2)
-        meta = {"stacktrace": [{"file":os.path.abspath(frame.f_code.co_filename),"line":frame.f_lineno,"name":frame.f_code.co_name} ] }
+        meta = {"stacktrace": [{"file":_source_path(frame.f_code.co_filename),"line":frame.f_lineno,"name":frame.f_code.co_name} ] }
     except:
         meta = {"stacktrace": []}
     return meta
@@ -173,6 +178,9 @@ class HashWrap:
         b_arg = b
         if isinstance(b,HashWrap): b_arg = b.arg
         if self.arg is b_arg: return True
+        if isinstance(self.arg,cs.MX) and isinstance(b_arg,cs.MX):
+            # Node identity; avoids constructing an MX comparison expression
+            return cs.is_equal(self.arg, b_arg)
         r = self.arg==b_arg
         return r.is_one()
 
@@ -364,6 +372,107 @@ def vcat(arg):
     else:
         return cs.vcat(arg)
 
+def horner(coeff, t):
+    """Evaluate polynomials at a scalar t using Horner's scheme
+
+    Parameters
+    ----------
+    coeff : :obj:`casadi.MX`
+        n-by-s matrix, column i holds the coefficients of t^i
+    t : :obj:`casadi.MX`
+        Scalar evaluation point
+
+    Returns
+    -------
+    n-by-1 column, identical to mtimes(coeff, vertcat(t**0, ..., t**(s-1)))
+    """
+    s = coeff.shape[1]
+    acc = coeff[:,s-1]
+    for i in range(s-2, -1, -1):
+        acc = acc*t + coeff[:,i]
+    return acc
+
+def horner_stacked(coeffs, t):
+    """Evaluate several polynomials at t in one shared Horner chain
+
+    Parameters
+    ----------
+    coeffs : list of :obj:`casadi.MX`
+        Coefficient matrices as in :func:`horner`, possibly with different numbers of columns
+    t : :obj:`casadi.MX`
+        Scalar evaluation point
+
+    Returns
+    -------
+    list with the evaluation of each coefficient matrix, identical to [horner(c, t) for c in coeffs]
+    """
+    if len(coeffs)<=1:
+        return [horner(c, t) for c in coeffs]
+    s = max(c.shape[1] for c in coeffs)
+    # Pad the lower order polynomials with structural zeros in the highest powers
+    stacked = cs.vcat([c if c.shape[1]==s else cs.horzcat(c, type(c)(c.shape[0], s-c.shape[1])) for c in coeffs])
+    offsets = [0]
+    for c in coeffs:
+        offsets.append(offsets[-1]+c.shape[0])
+    return cs.vertsplit(horner(stacked, t), offsets)
+
+def cache_dir():
+    """Directory for compiled artefacts that persist across sessions
+
+    Taken from the ROCKIT_CACHE environment variable, defaulting to ~/.cache/rockit
+    """
+    return os.environ.get("ROCKIT_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "rockit"))
+
+def jit_cached(f, flags=None):
+    """Compile a Function with the shell compiler, reusing earlier builds from disk
+
+    The shared library is keyed by a SHA1 of the serialized Function, the compiler flags,
+    the CasADi version, the compiler ($CC) and the platform,
+    such that a later session sampling the same expressions loads it instead of recompiling.
+
+    Parameters
+    ----------
+    f : :obj:`casadi.Function`
+        Function to compile; must support code generation
+    flags : list of str, optional
+        Compiler flags
+
+    Returns
+    -------
+    :obj:`casadi.Function`
+        External Function with the same signature as f
+    """
+    import glob
+    import hashlib
+    import platform
+    import uuid
+    flags = list(flags or [])
+    # A cache directory may outlive a CasADi upgrade or be shared across machines
+    build = (flags, cs.__version__, os.environ.get("CC"), sys.platform, platform.machine())
+    h = hashlib.sha1((f.serialize() + repr(build)).encode()).hexdigest()
+    directory = cache_dir()
+    base = os.path.join(directory, "%s_%s" % (f.name(), h))
+    for ext in (".so", ".dylib", ".dll"):
+        if os.path.exists(base + ext):
+            return external(f.name(), base + ext)
+    os.makedirs(directory, exist_ok=True)
+    # Build under a unique name and move into place, such that concurrent sessions never load a partial library
+    tmp = "%s_tmp%s" % (base, uuid.uuid4().hex)
+    try:
+        cg = CodeGenerator(os.path.basename(tmp) + ".c")
+        cg.add(f)
+        cg.generate(directory + os.sep)
+        Importer(tmp + ".c", "shell", {"name": tmp, "temp_suffix": False, "cleanup": False, "flags": flags})
+        for lib in glob.glob(tmp + ".*"):
+            ext = os.path.splitext(lib)[1]
+            if ext in (".so", ".dylib", ".dll"):
+                os.replace(lib, base + ext)
+                return external(f.name(), base + ext)
+        raise Exception("Compilation of %s did not produce a shared library" % f.name())
+    finally:
+        for leftover in glob.glob(tmp + ".*"):
+            os.remove(leftover)
+
 def prepare_build_dir(build_dir_abs):
     import os
     import shutil
@@ -167,6 +167,7 @@ class DirectCollocation(SamplingMethod):
             for i in range(self.M):
                 tr.append([self.integrator_grid[k][i]+dt*self.tau[j] for j in range(self.degree)])        
             self.tr.append(tr)
+        self.tr_vec = vcat([t for tr in self.tr for tr_i in tr for t in tr_i]) # All root times, stacked
 
         # Handle Bspline signals
         subgrid = []
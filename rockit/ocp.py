@@ -183,16 +183,14 @@ class Ocp(Stage):
     def is_sys_time_varying(self):
         # For checks
         self._ode()
-        ode = vvcat([self._state_der[k] for k in self.states])
-        alg = vvcat(self._alg)
+        ode, alg, _ = self._ode_exprs()
         rhs = vertcat(ode,alg)
         return depends_on(rhs, self.t)
 
     def is_parameter_appearing_in_sys(self):
         # For checks
         self._ode()
-        ode = vvcat([self._state_der[k] for k in self.states])
-        alg = vvcat(self._alg)
+        ode, alg, _ = self._ode_exprs()
         rhs = vertcat(ode,alg)
         pall = self.parameters['']+self.parameters['control']
         dep = [depends_on(rhs,p) for p in pall]
@@ -201,8 +199,7 @@ class Ocp(Stage):
     def sys_dae(self):
         # For checks
         self._ode()
-        ode = vvcat([self._state_der[k] for k in self.states])
-        alg = vvcat(self._alg)
+        ode, alg, _ = self._ode_exprs()
 
         dae = {}
         dae["x"] = self.x
@@ -238,8 +235,7 @@ class Ocp(Stage):
         intg_options = dict(intg_options)
         # For checks
         self._ode()
-        ode = vvcat([self._state_der[k] for k in self.states])
-        alg = vvcat(self._alg)
+        ode, alg, _ = self._ode_exprs()
 
         dae = {}
         dae["x"] = self.x
@@ -411,7 +411,9 @@ class SamplingMethod(DirectMethod):
         self.xr = []
         self.zr = []
         self.tr = []
+        self.tr_vec = MX(0, 1)
         self.q = 0
+        self._sampler_cache = {} # See Stage.sampler
 
     def discrete_system(self, stage):
         # Coefficient matrix from RK4 to reconstruct 4th order polynomial (k1,k2,k3,k4)
@@ -570,6 +572,7 @@ class SamplingMethod(DirectMethod):
             for k in range(self.N):
                 t_local = linspace(self.control_grid[k], self.control_grid[k+1], self.M+1)
                 self.integrator_grid.append(t_local[:-1] if k<self.N-1 else t_local)
+            self.integrator_grid_vec = vcat(self.integrator_grid) # All N*M+1 integrator time points
             #self.add_constraints_before(stage, opti)
             self.add_constraints(stage, opti)
             self.add_constraints_after(stage, opti)
@@ -597,14 +600,14 @@ class SamplingMethod(DirectMethod):
 
 
     def add_constraints_before(self, stage, opti):
-        for c, meta, args in stage._constraints["point"]:
-            e = self.eval(stage, c)
+        constraints = stage._constraints["point"]
+        for (c, meta, args), e in zip(constraints, self.eval_batch(stage, [c for c, _, _ in constraints])):
             if 'r_at_tf' not in [a.name() for a in symvar(e)]:
                 opti.subject_to(e, args["scale"], meta=meta)
 
     def add_constraints_after(self, stage, opti):
-        for c, meta, args in stage._constraints["point"]:
-            e = self.eval(stage, c)
+        constraints = stage._constraints["point"]
+        for (c, meta, args), e in zip(constraints, self.eval_batch(stage, [c for c, _, _ in constraints])):
             if 'r_at_tf' in [a.name() for a in symvar(e)]:
                 opti.subject_to(e, args["scale"], meta=meta)
 
@@ -781,12 +784,15 @@ class SamplingMethod(DirectMethod):
         return vcat(args)
 
     def eval(self, stage, expr):
-        return stage.master._method.eval_top(stage.master,
-                                             stage._expr_apply(expr,
-                                                               p=veccat(*self.P),
-                                                               v=self.V,
-                                                               t0=stage.t0,
-                                                               T=stage.T))
+        return self.eval_batch(stage, [expr])[0]
+
+    def eval_batch(self, stage, exprs):
+        exprs = stage._expr_apply_batch(exprs,
+                                        p=veccat(*self.P),
+                                        v=self.V,
+                                        t0=stage.t0,
+                                        T=stage.T)
+        return [stage.master._method.eval_top(stage.master, e) for e in exprs]
 
     def eval_at_control(self, stage, expr, k):
         try:
@@ -894,44 +900,80 @@ class SamplingMethod(DirectMethod):
                                  DT=DT,
                                  DT_control=DT_control)
 
+    def _integrator_args(self, stage, k, i):
+        """Substitutions of eval_at_integrator that vary along the grid"""
+        return dict(x=self.xk[k*self.M + i],
+                    xq=self.xqk[k*self.M + i],
+                    z=self.zk[k*self.M + i] if self.zk else nan,
+                    u=self.U[k], p_control=self.get_p_control_at(stage, k),
+                    p_control_plus=self.get_p_control_plus_at(stage, k),
+                    v_control=self.get_v_control_at(stage, k),
+                    v_control_plus=self.get_v_control_plus_at(stage, k),
+                    v_states=self.get_v_states_at(stage, k),
+                    t=self.integrator_grid[k][i],
+                    DT=self.get_DT_at(k, i),
+                    DT_control=self.get_DT_control_at(k))
+
+    def _integrator_root_args(self, stage, k, i, j):
+        """Substitutions of eval_at_integrator_root that vary along the grid"""
+        return dict(x=self.xr[k][i][:,j],
+                    z=self.zr[k][i][:,j] if self.zk else nan,
+                    u=self.U[k],
+                    p_control=self.get_p_control_at(stage, k),
+                    p_control_plus=self.get_p_control_plus_at(stage, k),
+                    v_control=self.get_v_control_at(stage, k),
+                    v_control_plus=self.get_v_control_plus_at(stage, k),
+                    t=self.tr[k][i][j],
+                    DT=self.get_DT_at(k, i),
+                    DT_control=self.get_DT_control_at(k))
+
     def eval_at_integrator(self, stage, expr, k, i):
-        DT_control = self.get_DT_control_at(k)
-        DT = self.get_DT_at(k, i)
         return stage.master._method.eval_top(stage.master,
                                              stage._expr_apply(expr,
                                                                t0=self.t0,
                                                                T=self.T,
-                                                               x=self.xk[k*self.M + i],
-                                                               xq=self.xqk[k*self.M + i],
-                                                               z=self.zk[k*self.M + i] if self.zk else nan,
-                                                               u=self.U[k], p_control=self.get_p_control_at(stage, k),
-                                                               p_control_plus=self.get_p_control_plus_at(stage, k),
                                                                v=self.V, p=veccat(*self.P),
-                                                               v_control=self.get_v_control_at(stage, k),
-                                                               v_control_plus=self.get_v_control_plus_at(stage, k),
-                                                               v_states=self.get_v_states_at(stage, k),
-                                                               t=self.integrator_grid[k][i],
-                                                               DT=DT,
-                                                               DT_control=DT_control))
+                                                               **self._integrator_args(stage, k, i)))
 
     def eval_at_integrator_root(self, stage, expr, k, i, j):
-        DT_control = self.get_DT_control_at(k)
-        DT = self.get_DT_at(k, i)
         return stage.master._method.eval_top(stage.master,
                                              stage._expr_apply(expr,
                                                                t0=self.t0,
                                                                T=self.T,
-                                                               x=self.xr[k][i][:,j],
-                                                               z=self.zr[k][i][:,j] if self.zk else nan,
-                                                               u=self.U[k],
-                                                               p_control=self.get_p_control_at(stage, k),
-                                                               p_control_plus=self.get_p_control_plus_at(stage, k),
                                                                v=self.V, p=veccat(*self.P),
-                                                               v_control=self.get_v_control_at(stage, k),
-                                                               v_control_plus=self.get_v_control_plus_at(stage, k),
-                                                               t=self.tr[k][i][j],
-                                                               DT=DT,
-                                                               DT_control=DT_control))
+                                                               **self._integrator_root_args(stage, k, i, j)))
+
+    def eval_at_integrator_grid(self, stage, expr, roots=False):
+        """Horizontal concatenation of eval_at_integrator (or eval_at_integrator_root) over the whole grid
+
+        The substitution is done once on symbolic stand-ins and mapped over the grid points.
+        Returns None when that is not possible; callers then fall back to pointwise evaluation.
+        """
+        if roots:
+            if type(self).eval_at_integrator_root is not SamplingMethod.eval_at_integrator_root: return None
+            args = [self._integrator_root_args(stage, k, i, j) for k in range(self.N) for i in range(self.M) for j in range(self.xr[k][i].shape[1])]
+        else:
+            if type(self).eval_at_integrator is not SamplingMethod.eval_at_integrator: return None
+            args = [self._integrator_args(stage, k, i) for k in range(self.N) for i in range(self.M)]
+        if not args: return None
+        shared = dict(t0=self.t0, T=self.T, v=self.V, p=veccat(*self.P))
+        shared = {key: value for key, value in shared.items() if value is not None}
+
+        varying_values = {key: [MX(a[key]) for a in args] for key in args[0]}
+        for values in varying_values.values():
+            shape = values[0].shape
+            if any(v.shape!=shape for v in values): return None
+        shared_values = {key: MX(value) for key, value in shared.items()}
+
+        varying_syms = {key: MX.sym(key, *values[0].shape) for key, values in varying_values.items()}
+        shared_syms = {key: MX.sym(key, *value.shape) for key, value in shared_values.items()}
+        e = stage._expr_apply(expr, **varying_syms, **shared_syms)
+        inputs = list(varying_syms.values()) + list(shared_syms.values())
+        # Anything left unsubstituted (e.g. offsets, signals) needs pointwise evaluation
+        if any(not any(is_equal(s, i) for i in inputs) for s in symvar(e)): return None
+        F = Function('grid_point', inputs, [e])
+        res = F.map(len(args))(*[hcat(values) for values in varying_values.values()], *shared_values.values())
+        return stage.master._method.eval_top(stage.master, res)
 
     def set_initial(self, stage, master, initial):
         opti = master.opti if hasattr(master, 'opti') else master
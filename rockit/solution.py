@@ -21,7 +21,7 @@
 #
 
 import numpy as np
-from casadi import vertcat, vcat, DM, Function, hcat, MX
+from casadi import vertcat, vcat, vec, DM, Function, hcat, MX
 from .casadi_helpers import DM2numpy
 from numpy import nan
 import functools
@@ -82,11 +82,15 @@ class OcpSolution:
         >>> sol = ocp.solve()
         >>> tx, xs = sol.sample(x, grid='control')
         """
-        time, res = self.stage.sample(expr, grid, **kwargs)
-        res = self.sol.value(res)
-        return self.sol.value(time), DM2numpy(res, MX(expr).shape, time.numel())
-
-    def sampler(self, *args):
+        time, res = self.stage._sample_numeric(expr, grid, **kwargs)
+        # Evaluate time grid and samples in a single numeric pass
+        n = time.numel()
+        v = np.atleast_1d(self.sol.value(vertcat(vec(time), vec(res))))
+        time = v[0] if n==1 else v[:n]
+        res = np.reshape(v[n:], res.shape, order='F')
+        return time, DM2numpy(res, MX(expr).shape, n)
+
+    def sampler(self, *args, jit=False, parallelization='serial'):
         """Returns a function that samples given expressions
 
 
@@ -102,6 +106,12 @@ class OcpSolution:
             Name for CasADi Function
         options : dict, optional
             Options for CasADi Function
+        jit : bool, optional
+            Just-in-time compile the sampling Function (requires a C compiler)
+            Default: False
+        parallelization : str, optional
+            Parallelization over time-points: 'serial', 'openmp' or 'thread'
+            Default: 'serial'
 
         Returns
         -------
@@ -120,7 +130,7 @@ class OcpSolution:
         >>> s = sol.sampler(x)
         >>> s(1.0) # Value of x at t=1.0
         """
-        s = self.stage.sampler(*args)
+        s = self.stage.sampler(*args, jit=jit, parallelization=parallelization)
         ret = functools.partial(s, self.gist)
         ret.__doc__ = """
                 Parameters
@@ -21,7 +21,7 @@
 #
 from casadi import MX, substitute, Function, vcat, depends_on, vertcat, jacobian, veccat, jtimes, hcat,\
                    linspace, DM, constpow, mtimes, low, floor, hcat, horzcat, DM, is_equal, \
-                   Sparsity
+                   Sparsity, vec, repmat, reshape
 import casadi as ca
 from rockit.grouping_techniques import GroupingTechnique
 from .freetime import FreeTime
@@ -29,7 +29,7 @@ from .direct_method import DirectMethod
 from .multiple_shooting import MultipleShooting
 from .single_shooting import SingleShooting
 from collections import defaultdict
-from .casadi_helpers import DM2numpy, get_meta, merge_meta, HashDict, HashDefaultDict, HashOrderedDict, HashList, for_all_primitives
+from .casadi_helpers import DM2numpy, get_meta, merge_meta, HashDict, HashDefaultDict, HashOrderedDict, HashList, for_all_primitives, horner_stacked, jit_cached
 from contextlib import contextmanager
 from collections import OrderedDict
 from .casadi_helpers import vvcat
@@ -37,6 +37,28 @@ from .casadi_helpers import vvcat
 import numpy as np
 from numpy import nan
 
+# Canonical grid names -> (grid, include_first, include_last)
+# A leading '-' drops the first point, a trailing '-' drops the last point
+_GRID_TABLE = {}
+for _g in ('control', 'integrator', 'integrator_roots', 'gist'):
+    _GRID_TABLE[_g] = (_g, True, True)
+    _GRID_TABLE['-' + _g] = (_g, False, True)
+    _GRID_TABLE[_g + '-'] = (_g, True, False)
+    _GRID_TABLE['-' + _g + '-'] = (_g, False, False)
+del _g
+
+# Constant building blocks of the refined integrator time grid, keyed on (M, refine)
+_FINE_GRID_CONSTANTS = {}
+
+# Shared stand-in for empty symbol categories (no controls, parameters, ...)
+_EMPTY_COL = MX(0, 1)
+
+# Default compiler flags for Stage.sampler(..., jit=True)
+_SAMPLER_JIT_FLAGS = ["-O3"]
+
+# Number of distinct expression lists for which Stage.sampler keeps its expression Function
+_SAMPLER_EXPR_CACHE_SIZE = 8
+
 def transcribed(func):
     def function_wrapper(self, *args, **kwargs):
         return func(self._transcribed, *args, **kwargs)
@@ -76,6 +98,16 @@ class Stage:
 
         Each stage has a transcription method associated with it.
     """
+    # Many stages may be alive at once (cloned sub-stages); avoid a per-instance __dict__
+    __slots__ = ('_cache', '_suspend_dirty',
+                 'states', 'qstates', 'controls', 'algebraics', 'parameters', 'variables',
+                 '_master', 'parent', '_meta', '_scale', '_var_original', '_var_augmented',
+                 '_signals', '_param_vals', '_state_der', '_scale_der', '_state_next', '_alg',
+                 '_constraints', '_objective', '_initial', '_catalog',
+                 '_placeholders', '_offsets', '_inf_inert', '_inf_der', '_t', '_stages', '_method',
+                 '_t0', '_T', '_public_T', '_public_t0', '_tf', '_public_DT', '_public_DT_control',
+                 '_T_scale', '_var_is_transcribed')
+
     def __init__(self, parent=None, t0=0, T=1, scale=1, clone=False):
         """Create an Optimal Control Problem stage.
         
@@ -102,6 +134,12 @@ class Stage:
 
         >>> stage = Stage()
         """
+        # Memoized expressions derived from the declared symbols
+        # Cleared on every mutation (see _set_transcribed)
+        self._cache = {}
+        # Set by bulk(): mutations skip notifying the master
+        self._suspend_dirty = False
+
         self.states = HashList()
         self.qstates = HashList()
         self.controls = HashList()
@@ -141,7 +179,7 @@ class Stage:
         self._T = T
         self._public_T  = self._create_placeholder_expr(0, 'T')
         self._public_t0 = self._create_placeholder_expr(0, 't0')
-        self._tf = self.T + self.t0
+        self._tf = None # Built on first access of tf
         self._public_DT = self._create_placeholder_expr(0, 'DT')
         self._public_DT_control = self._create_placeholder_expr(0, 'DT_control')
         self._T_scale = scale
@@ -164,6 +202,8 @@ class Stage:
 
     @property
     def tf(self):
+        if self._tf is None:
+            self._tf = self.T + self.t0
         return self._tf
     
     @property 
@@ -180,6 +220,32 @@ class Stage:
     def set_T(self, T):
         self._T = T
 
+    @contextmanager
+    def bulk(self):
+        """Group a large number of problem modifications
+
+        The master problem is marked as needing transcription when entering
+        and when leaving the context, rather than on every single modification.
+        Do not solve or sample inside the context.
+
+        Examples
+        --------
+
+        >>> ocp = Ocp()
+        >>> with ocp.bulk():
+        ...     xs = [ocp.state() for i in range(1000)]
+        """
+        if self._suspend_dirty:
+            yield self
+            return
+        self._set_transcribed(False)
+        self._suspend_dirty = True
+        try:
+            yield self
+        finally:
+            self._suspend_dirty = False
+            self._set_transcribed(False)
+
     def _param_value(self, p):
         if p not in self._param_vals:
             raise Exception("You forgot to declare a value (using ocp.set_value) of the following parameter: " + str(self._meta[p]))
@@ -253,9 +319,7 @@ class Stage:
         >>> ocp.set_der(x, -x)
         >>> ocp.set_initial(x, sin(ocp.t)) # Optional: give initial guess
         """
-        import numpy
         # Create a placeholder symbol with a dummy name (see #25)
-
         name = "q"+str(len(self.qstates)+1) if quad else "x"+str(len(self.states)+1)
         x = MX.sym(name, n_rows, n_cols)
         meta = merge_meta(meta, get_meta())
@@ -353,7 +417,7 @@ class Stage:
         >>> ocp.set_initial(v, 3)
         """
         # Create a placeholder symbol with a dummy name (see #25)
-        L = sum([len(e) for e in self.variables.values()])
+        L = sum(len(e) for e in self.variables.values())
         v = MX.sym("v"+str(L+1), n_rows, n_cols)
         meta = merge_meta(meta, get_meta())
         return self.register_variable(v, grid=grid, order=order, scale=scale, meta=meta, domain=domain, include_last=include_last)
@@ -427,7 +491,7 @@ class Stage:
         >>> ocp.set_value(p, 3)
         """
         # Create a placeholder symbol with a dummy name (see #25)
-        L = sum([len(e) for e in self.parameters.values()])
+        L = sum(len(e) for e in self.parameters.values())
         p = MX.sym("p"+str(L+1), n_rows, n_cols)
         meta = merge_meta(meta, get_meta())
         return self.register_parameter(p, grid=grid, order=order, scale=scale, include_last=include_last, meta=meta)
@@ -662,12 +726,12 @@ class Stage:
             raise Exception("Dependency on controls not supported yet for stage.der")
         ode = self._ode()
         if depends_on(expr,self.t) or nominal_symbols:
-            return jtimes(expr, vertcat(self.x, self.t, *nominal_symbols), vertcat(ode(x=self.x, u=self.u, z=self.z, p=vertcat(self.p, self.v), t=self.t)["ode"], 1, *der_symbols))
+            return jtimes(expr, vertcat(self.x, self.t, *nominal_symbols), vertcat(ode(x=self.x, u=self.u, z=self.z, p=self._pv, t=self.t)["ode"], 1, *der_symbols))
         else:
             if expr in self.states:
-                return jtimes(expr, self.x, ode.call(dict(x=self.x, u=self.u, z=self.z, p=vertcat(self.p, self.v), t=self.t),True,False)["ode"])
+                return jtimes(expr, self.x, ode.call(dict(x=self.x, u=self.u, z=self.z, p=self._pv, t=self.t),True,False)["ode"])
             else:
-                return jtimes(expr, self.x, ode(x=self.x, u=self.u, z=self.z, p=vertcat(self.p, self.v), t=self.t)["ode"])
+                return jtimes(expr, self.x, ode(x=self.x, u=self.u, z=self.z, p=self._pv, t=self.t)["ode"])
 
 
     def integral(self, expr, grid='inf',refine=1):
@@ -816,11 +880,12 @@ class Stage:
         """
         self._set_transcribed(False)
         #import ipdb; ipdb.set_trace()
+        signal = self.is_signal(constr)
         if grid is None:
-            grid = 'control' if self.is_signal(constr) else 'point'
-        if grid not in ['point', 'control', 'inf', 'integrator', 'integrator_roots']:
+            grid = 'control' if signal else 'point'
+        if grid not in ('point', 'control', 'inf', 'integrator', 'integrator_roots'):
             raise Exception("Invalid argument")
-        if self.is_signal(constr):
+        if signal:
             if grid == 'point':
                 raise Exception("Got a signal expression for grid 'point'.")
         else:
@@ -897,10 +962,16 @@ class Stage:
 
         """
         assert not self.is_signal(term), "An objective cannot be a signal. You must use ocp.integral or ocp.at_t0/tf to remove the time-dependence"
+        term_mx = MX(term)
+        if not term_mx.is_scalar():
+            raise Exception("Objective terms must be scalar, got " + str(term_mx.dim())+ ".")
+        # Adding a structural zero leaves the problem unchanged
+        if term_mx.is_zero(): return
         self._set_transcribed(False)
-        self._objective = self._objective + term
-        if not MX(term).is_scalar():
-            raise Exception("Objective terms must be scalar, got " + str(MX(term).dim())+ ".")
+        if MX(self._objective).is_zero():
+            self._objective = term
+        else:
+            self._objective = self._objective + term
 
     def method(self, method):
         """Specify the transcription method
@@ -931,30 +1002,48 @@ class Stage:
 
     @property
     def x(self):
-        return vvcat(self.states)
+        if 'x' not in self._cache:
+            self._cache['x'] = _EMPTY_COL if len(self.states)==0 else vvcat(self.states)
+        return self._cache['x']
 
     @property
     def xq(self):
-        return vvcat(self.qstates)
+        if 'xq' not in self._cache:
+            self._cache['xq'] = _EMPTY_COL if len(self.qstates)==0 else vvcat(self.qstates)
+        return self._cache['xq']
 
     @property
     def u(self):
-        if len(self.controls)==0: return MX(0, 1)
-        return vvcat(self.controls)
+        if 'u' not in self._cache:
+            self._cache['u'] = _EMPTY_COL if len(self.controls)==0 else vvcat(self.controls)
+        return self._cache['u']
 
     @property
     def z(self):
-        return vvcat(self.algebraics)
+        if 'z' not in self._cache:
+            self._cache['z'] = _EMPTY_COL if len(self.algebraics)==0 else vvcat(self.algebraics)
+        return self._cache['z']
 
     @property
     def p(self):
-        arg = self.parameters['']+self.parameters['control']+self.parameters['control+']+self.parameters['bspline']
-        return MX(0, 1) if len(arg)==0 else vvcat(arg)
+        if 'p' not in self._cache:
+            arg = self.parameters['']+self.parameters['control']+self.parameters['control+']+self.parameters['bspline']
+            self._cache['p'] = _EMPTY_COL if len(arg)==0 else vvcat(arg)
+        return self._cache['p']
 
     @property
     def v(self):
-        arg = self.variables['']+self.variables['control']+self.variables['control+']+self.variables['bspline']
-        return MX(0, 1) if len(arg)==0 else vvcat(arg)
+        if 'v' not in self._cache:
+            arg = self.variables['']+self.variables['control']+self.variables['control+']+self.variables['bspline']
+            self._cache['v'] = _EMPTY_COL if len(arg)==0 else vvcat(arg)
+        return self._cache['v']
+
+    @property
+    def _pv(self):
+        """Parameters and variables stacked, as passed to the system Functions"""
+        if 'pv' not in self._cache:
+            self._cache['pv'] = vertcat(self.p, self.v)
+        return self._cache['pv']
 
     @property
     def p_global_list(self): return self.parameters['']
@@ -981,28 +1070,28 @@ class Stage:
     def v_integrator_roots_list(self): return self.variables['bspline']
 
     @property
-    def p_global(self): return MX(0, 1) if len(self.p_global_list)==0 else vvcat(self.p_global_list)
+    def p_global(self): return _EMPTY_COL if len(self.p_global_list)==0 else vvcat(self.p_global_list)
 
     @property
-    def p_control(self): return MX(0, 1) if len(self.p_control_list)==0 else vvcat(self.p_control_list)
+    def p_control(self): return _EMPTY_COL if len(self.p_control_list)==0 else vvcat(self.p_control_list)
     
     @property
-    def p_integrator(self): return MX(0, 1) if len(self.p_integrator_list)==0 else vvcat(self.p_integrator_list)
+    def p_integrator(self): return _EMPTY_COL if len(self.p_integrator_list)==0 else vvcat(self.p_integrator_list)
 
     @property
-    def p_integrator_roots(self): return MX(0, 1) if len(self.p_integrator_roots_list)==0 else vvcat(self.p_integrator_roots_list)
+    def p_integrator_roots(self): return _EMPTY_COL if len(self.p_integrator_roots_list)==0 else vvcat(self.p_integrator_roots_list)
 
     @property
-    def v_global(self): return MX(0, 1) if len(self.v_global_list)==0 else vvcat(self.v_global_list)
+    def v_global(self): return _EMPTY_COL if len(self.v_global_list)==0 else vvcat(self.v_global_list)
 
     @property
-    def v_control(self): return MX(0, 1) if len(self.v_control_list)==0 else vvcat(self.v_control_list)
+    def v_control(self): return _EMPTY_COL if len(self.v_control_list)==0 else vvcat(self.v_control_list)
     
     @property
-    def v_integrator(self): return MX(0, 1) if len(self.v_integrator_list)==0 else vvcat(self.v_integrator_list)
+    def v_integrator(self): return _EMPTY_COL if len(self.v_integrator_list)==0 else vvcat(self.v_integrator_list)
 
     @property
-    def v_integrator_roots(self): return MX(0, 1) if len(self.v_integrator_roots_list)==0 else vvcat(self.v_integrator_roots_list)
+    def v_integrator_roots(self): return _EMPTY_COL if len(self.v_integrator_roots_list)==0 else vvcat(self.v_integrator_roots_list)
     
     @property
     def pv_global(self): return ca.vertcat(self.p_global, self.v_global)
@@ -1097,8 +1186,13 @@ class Stage:
         res : bool
 
         """
- 
-        return depends_on(expr, vertcat(self.x, self.u, self.z, self.t, self.DT, self.DT_control, vcat(self.parameters['control']+self.parameters['control+']), vcat(self.variables['control']+self.variables['control+']+self.variables['states']),vvcat(self._signals.keys()), vvcat(self._inf_der.keys())))
+        # Signal derivatives and inf_der symbols are registered without a mutation notice
+        key = (len(self._signals), len(self._inf_der))
+        cached = self._cache.get('signal_bundle')
+        if cached is None or cached[0]!=key:
+            bundle = vertcat(self.x, self.u, self.z, self.t, self.DT, self.DT_control, vcat(self.parameters['control']+self.parameters['control+']), vcat(self.variables['control']+self.variables['control+']+self.variables['states']),vvcat(self._signals.keys()), vvcat(self._inf_der.keys()))
+            cached = self._cache['signal_bundle'] = (key, bundle)
+        return depends_on(expr, cached[1])
 
     def is_parametric(self, expr):
         """Does the expression depend only on parameters?
@@ -1168,34 +1262,46 @@ class Stage:
             if len_before==len_after: break
 
     # Internal methods
+    def _ode_exprs(self):
+        """Stacked (ode, alg, quad) right-hand sides, cached until the next mutation"""
+        if 'ode_exprs' not in self._cache:
+            der = []
+            for k in self.states:
+                try:
+                    der.append(self._state_der[k])
+                except:
+                    raise Exception("ocp.set_der missing for state defined at " + str(self._meta[k]))
+            ode = veccat(*der)
+            der = []
+            for k in self.qstates:
+                try:
+                    der.append(self._state_der[k])
+                except:
+                    raise Exception("ocp.set_der missing for quadrature state defined at " + str(self._meta[k]))
+            quad = veccat(*der)
+            alg = veccat(*self._alg)
+            self._cache['ode_exprs'] = (ode, alg, quad)
+        return self._cache['ode_exprs']
+
     def _ode(self):
-        der = []
-        for k in self.states:
-            try:
-                der.append(self._state_der[k])
-            except:
-                raise Exception("ocp.set_der missing for state defined at " + str(self._meta[k]))
-        ode = veccat(*der)
-        der = []
-        for k in self.qstates:
-            try:
-                der.append(self._state_der[k])
-            except:
-                raise Exception("ocp.set_der missing for quadrature state defined at " + str(self._meta[k]))
-        quad = veccat(*der)
-        alg = veccat(*self._alg)
+        if 'ode' in self._cache:
+            return self._cache['ode']
+        ode, alg, quad = self._ode_exprs()
         t = self.t
         expr = vertcat(ode,alg,quad)
         if not depends_on(expr,t):
             t = MX.sym('t', Sparsity(1, 1))
         assert not depends_on(expr,self.DT), "Your ODE right-hand-side depends on DT; not supported."
         assert not depends_on(expr,self.DT_control), "Your ODE right-hand-side depends on DT_control; not supported."
-        ret = Function('ode', [self.x, self.u, self.z, vertcat(self.p, self.v), t], [ode, alg, quad], ["x", "u", "z", "p", "t"], ["ode","alg","quad"])
+        ret = Function('ode', [self.x, self.u, self.z, self._pv, t], [ode, alg, quad], ["x", "u", "z", "p", "t"], ["ode","alg","quad"])
         assert not ret.has_free()
+        self._cache['ode'] = ret
         return ret
 
     # Internal methods
     def _diffeq(self):
+        if 'diffeq' in self._cache:
+            return self._cache['diffeq']
         val = []
         for k in self.states:
             try:
@@ -1214,18 +1320,34 @@ class Stage:
         t = self.t
         if not depends_on(vertcat(next,quad), self.t):
             t = MX.sym('t', Sparsity(1, 1))
-        return Function('diffeq', [self.x, self.u, vertcat(self.p, self.v), t, self.DT, self.DT_control, MX(0,1)], [next, MX(), quad, MX(), MX(0, 1), MX()], ["x0", "u", "p", "t0", "DT", "DT_control","z0"], ["xf","poly_coeff","qf","poly_coeff_q","zf","poly_coeff_z"])
+        self._cache['diffeq'] = Function('diffeq', [self.x, self.u, self._pv, t, self.DT, self.DT_control, MX(0,1)], [next, MX(), quad, MX(), MX(0, 1), MX()], ["x0", "u", "p", "t0", "DT", "DT_control","z0"], ["xf","poly_coeff","qf","poly_coeff_q","zf","poly_coeff_z"])
+        return self._cache['diffeq']
 
     def _expr_apply(self, expr, **kwargs):
         """
         Substitute placeholder symbols with actual decision variables,
         or expressions involving decision variables
         """
+        return self._expr_apply_batch([expr], **kwargs)[0]
+
+    def _expr_apply_batch(self, exprs, **kwargs):
+        """
+        Same as _expr_apply, for a list of expressions sharing the same substitution
+
+        The substitution set is computed once and applied with a single substitute call
+        """
         subst_from, subst_to = self._get_subst_set(**kwargs)
         temp = [(f,t) for f,t in zip(subst_from, subst_to) if f is not None and not f.is_empty() and t is not None]
         subst_from = [e[0] for e in temp]
         subst_to = [e[1] for e in temp]
-        return substitute([MX(expr)], subst_from, subst_to)[0]
+        return substitute([MX(e) for e in exprs], subst_from, subst_to)
+
+    def _veccat_cached(self, kind, grid):
+        """veccat of the parameters/variables declared on a grid, memoized until the next mutation"""
+        key = (kind, grid)
+        if key not in self._cache:
+            self._cache[key] = veccat(*getattr(self, kind)[grid])
+        return self._cache[key]
 
     def _get_subst_set(self, **kwargs):
         subst_from = []
@@ -1259,31 +1381,31 @@ class Stage:
             subst_from.append(self.u)
             subst_to.append(kwargs["u"])
         if "p" in kwargs and self.parameters['']:
-            p = veccat(*self.parameters[''])
+            p = self._veccat_cached('parameters', '')
             subst_from.append(p)
             subst_to.append(kwargs["p"])
         if "p_control" in kwargs and self.parameters['control']:
-            p = veccat(*self.parameters['control'])
+            p = self._veccat_cached('parameters', 'control')
             subst_from.append(p)
             subst_to.append(kwargs["p_control"])
         if "p_control_plus" in kwargs and self.parameters['control+']:
-            p = veccat(*self.parameters['control+'])
+            p = self._veccat_cached('parameters', 'control+')
             subst_from.append(p)
             subst_to.append(kwargs["p_control_plus"])
         if "v" in kwargs and self.variables['']:
-            v = veccat(*self.variables[''])
+            v = self._veccat_cached('variables', '')
             subst_from.append(v)
             subst_to.append(kwargs["v"])
         if "v_control" in kwargs and self.variables['control']:
-            v = veccat(*self.variables['control'])
+            v = self._veccat_cached('variables', 'control')
             subst_from.append(v)
             subst_to.append(kwargs["v_control"])
         if "v_control_plus" in kwargs and self.variables['control+']:
-            v = veccat(*self.variables['control+'])
+            v = self._veccat_cached('variables', 'control+')
             subst_from.append(v)
             subst_to.append(kwargs["v_control_plus"])
         if "v_states" in kwargs and self.variables['states']:
-            v = veccat(*self.variables['states'])
+            v = self._veccat_cached('variables', 'states')
             subst_from.append(v)
             subst_to.append(kwargs["v_states"])
         if "signals" in kwargs:
@@ -1318,6 +1440,9 @@ class Stage:
             return self
 
     def _set_transcribed(self, val):
+        if not val:
+            self._cache.clear()
+            if self._suspend_dirty: return
         if self.master:
             if self._is_original:
                 self.master._var_is_transcribed = val
@@ -1381,19 +1506,21 @@ class Stage:
         from copy import copy, deepcopy
 
         # Placeholders need to be updated
-        subst_from = list(self._placeholders.keys())
+        subst_from = []
         subst_to = []
-        for k in self._placeholders.keys():
-            if is_equal(k, self.T):  # T and t0 already have new placeholder symbols
-                subst_to.append(ret.T)
-            elif is_equal(k, self.t0):
-                subst_to.append(ret.t0)
-            elif is_equal(k, self.t):
-                subst_to.append(ret.t)
+        for k, v in self._placeholders.items():
+            # Placeholder keys are the very objects handed out by T/t0/t
+            if k is self._public_T:  # T and t0 already have new placeholder symbols
+                k_new = ret.T
+            elif k is self._public_t0:
+                k_new = ret.t0
+            elif k is self._t:
+                k_new = ret.t
             else:
-                subst_to.append(MX.sym(k.name(), k.sparsity()))
-        for k_old, k_new in zip(subst_from, subst_to):
-            ret._placeholders[k_new] = self._placeholders[k_old]
+                k_new = MX.sym(k.name(), k.sparsity())
+            subst_from.append(k)
+            subst_to.append(k_new)
+            ret._placeholders[k_new] = v
 
         ret.states = copy(self.states)
         ret.controls = copy(self.controls)
@@ -1407,21 +1534,23 @@ class Stage:
         ret._scale_der = copy(self._scale_der)
         ret._alg = copy(self._alg)
         ret._state_next = copy(self._state_next)
-        constr_types = self._constraints.keys()
+        # Column view (expressions, meta, args) per constraint grid
+        columns = OrderedDict((k, tuple(zip(*v)) if v else ((), (), ())) for k, v in self._constraints.items())
         orig = []
-        for k in constr_types:
-            orig.extend([c for c, _, _ in self._constraints[k]])
+        for exprs, _, _ in columns.values():
+            orig.extend(exprs)
         n_constr = len(orig)
         orig.append(self._objective)
         orig.extend(self._initial.keys())
         res = substitute(orig, subst_from, subst_to)
         ret._objective = res[n_constr]
-        r = res[:n_constr]
         ret._constraints = defaultdict(list)
-        for k in constr_types:
-            v = self._constraints[k]
-            ret._constraints[k] = list(zip(r, [merge_meta(m, get_meta()) for _, m, _ in v], [d for _, _, d in v]))
-            r = r[len(v):]
+        meta = get_meta()
+        cursor = 0
+        for k, (exprs, metas, args) in columns.items():
+            n = len(exprs)
+            ret._constraints[k] = list(zip(res[cursor:cursor+n], [merge_meta(m, meta) for m in metas], args))
+            cursor += n
 
         ret._initial = HashOrderedDict(zip(res[n_constr+1:], self._initial.values()))
 
@@ -1440,22 +1569,28 @@ class Stage:
 
         ret._var_is_transcribed = False
         ret._T_scale = self._T_scale
+        ret._cache.clear()
         return ret
 
     def __deepcopy__(self, memo):
-        # Get default deepcopy behaviour
-        import copy
-        deepcopy_method = self.__deepcopy__
-        self.__deepcopy__ = None
-        cp = copy.deepcopy(self, memo)
-        self.__deepcopy__ = deepcopy_method
-        cp.__deepcopy__ = deepcopy_method
+        # Default deepcopy behaviour, over both slots and (subclass) __dict__
+        from copy import deepcopy
+        cp = self.__class__.__new__(self.__class__)
+        memo[id(self)] = cp
+        for k in Stage.__slots__:
+            if k not in ('_cache', '_var_augmented', '_method') and hasattr(self, k):
+                setattr(cp, k, deepcopy(getattr(self, k), memo))
+        for k, v in getattr(self, '__dict__', {}).items():
+            setattr(cp, k, deepcopy(v, memo))
 
         # Custom amendments
+        # A copy is never itself augmented, even if self was transcribed before
         cp._var_original = self
+        cp._var_augmented = None
         self._var_augmented = cp
 
         cp._method = self._method
+        cp._cache = {}
 
         return cp
 
@@ -1467,11 +1602,15 @@ class Stage:
 
     @staticmethod
     def _parse_grid(grid):
+        try:
+            return _GRID_TABLE[grid]
+        except KeyError:
+            pass
         include_last = True
         include_first = True
         if grid.startswith('-'):
             grid = grid[1:]
-            include_last = False
+            include_first = False
         if grid.endswith('-'):
             grid = grid[:-1]
             include_last = False
@@ -1510,8 +1649,20 @@ class Stage:
         placeholders = self.master.placeholders_transcribed
         time, res = self._sample(expr, grid=grid, **kwargs)
         return placeholders(time), placeholders(res)
-    
-    def _sample(self, expr, grid='control', **kwargs):
+
+    @transcribed
+    def _sample_numeric(self, expr, grid='control', **kwargs):
+        """Sample expression on a given grid, for numerical evaluation only
+
+        Unlike sample, integrator grids may be evaluated through a mapped Function.
+        The result then no longer contains the decision variables themselves
+        and is unfit as e.g. Function input or set_initial target.
+        """
+        placeholders = self.master.placeholders_transcribed
+        time, res = self._sample(expr, grid=grid, mapped=True, **kwargs)
+        return placeholders(time), placeholders(res)
+
+    def _sample(self, expr, grid='control', mapped=False, **kwargs):
         grid, include_first, include_last = self._parse_grid(grid)
         kwargs["include_first"] = include_first
         kwargs["include_last"] = include_last
@@ -1523,9 +1674,9 @@ class Stage:
             if 'refine' in kwargs and kwargs["refine"] is not None:
                 time, res = self._grid_intg_fine(self, expr, grid, **kwargs)
             else:
-                time, res = self._grid_integrator(self, expr, grid, **kwargs)
+                time, res = self._grid_integrator(self, expr, grid, mapped=mapped, **kwargs)
         elif grid == 'integrator_roots':
-            time, res = self._grid_integrator_roots(self, expr, grid, **kwargs)
+            time, res = self._grid_integrator_roots(self, expr, grid, mapped=mapped, **kwargs)
         elif grid == 'gist':
             time, res = self._grid_gist(self, expr, grid, **kwargs)
         else:
@@ -1561,111 +1712,164 @@ class Stage:
         time = stage._method.control_grid
         return time, res
 
-    def _grid_integrator(self, stage, expr, grid, include_first=True, include_last=True):
-        """Evaluate expression at (N*M + 1) integrator discretization points."""
+    def _grid_integrator(self, stage, expr, grid, include_first=True, include_last=True, mapped=False):
+        """Evaluate expression at (N*M + 1) integrator discretization points.
+
+        With mapped, the points may be evaluated through one mapped Function (numerical use only).
+        """
+        method = stage._method
         sub_expr = []
-        time = []
         assert include_first
-        for k in range(stage._method.N):
-            for l in range(stage._method.M):
-                sub_expr.append(stage._method.eval_at_integrator(stage, expr, k, l))
-            time.append(stage._method.integrator_grid[k])
+        if not stage.is_signal(expr) and not depends_on(expr, stage.xq):
+            # Constant over the grid: evaluate once
+            n = method.N*method.M + (1 if include_last else 0)
+            return method.integrator_grid_vec, repmat(method.eval_at_control(stage, expr, 0), 1, n)
+        res_mapped = method.eval_at_integrator_grid(stage, expr) if mapped and hasattr(method, "eval_at_integrator_grid") else None
+        if res_mapped is None:
+            for k in range(method.N):
+                for l in range(method.M):
+                    sub_expr.append(method.eval_at_integrator(stage, expr, k, l))
+        else:
+            sub_expr.append(res_mapped)
         if include_last:
-            sub_expr.append(stage._method.eval_at_control(stage, expr, -1))
-        return vcat(time), hcat(sub_expr)
+            sub_expr.append(method.eval_at_control(stage, expr, -1))
+        return method.integrator_grid_vec, hcat(sub_expr)
 
 
-    def _grid_integrator_roots(self, stage, expr, grid, include_first=True, include_last=True):
-        """Evaluate expression at integrator roots."""
+    def _grid_integrator_roots(self, stage, expr, grid, include_first=True, include_last=True, mapped=False):
+        """Evaluate expression at integrator roots.
+
+        With mapped, the roots may be evaluated through one mapped Function (numerical use only).
+        """
+        method = stage._method
         sub_expr = []
-        tr = []
         assert include_first
         assert include_last
-        for k in range(stage._method.N):
-            for l in range(stage._method.M):
-                for j in range(stage._method.xr[k][l].shape[1]):
-                    sub_expr.append(stage._method.eval_at_integrator_root(stage, expr, k, l, j))
-                tr.extend(stage._method.tr[k][l])
-        return hcat(tr).T, hcat(sub_expr)
+        res_mapped = method.eval_at_integrator_grid(stage, expr, roots=True) if mapped and hasattr(method, "eval_at_integrator_grid") else None
+        if res_mapped is None:
+            # Number of roots per integrator interval
+            J_tab = [[xr_kl.shape[1] for xr_kl in xr_k] for xr_k in method.xr]
+            for k in range(method.N):
+                for l in range(method.M):
+                    for j in range(J_tab[k][l]):
+                        sub_expr.append(method.eval_at_integrator_root(stage, expr, k, l, j))
+        else:
+            sub_expr.append(res_mapped)
+        return method.tr_vec, hcat(sub_expr)
 
     def _grid_intg_fine(self, stage, expr, grid, refine, include_first=True, include_last=True):
         """Evaluate expression at extra fine integrator discretization points."""
+        method = stage._method
         assert include_first
         assert include_last
-        if depends_on(expr,stage.x) and stage._method.poly_coeff is None:
-            msg = "No polynomal coefficients for the {} integration method".format(stage._method.intg)
+        if depends_on(expr,stage.x) and method.poly_coeff is None:
+            msg = "No polynomal coefficients for the {} integration method".format(method.intg)
             raise Exception(msg)
-        if depends_on(expr,stage.xq) and stage._method.poly_coeff_q is None:
-            msg = "No quadrature polynomal coefficients for the {} integration method".format(stage._method.intg)
+        if depends_on(expr,stage.xq) and method.poly_coeff_q is None:
+            msg = "No quadrature polynomal coefficients for the {} integration method".format(method.intg)
             raise Exception(msg)
-        N, M = stage._method.N, stage._method.M
-
-        expr_f = Function('expr', [stage.t, stage.x, stage.xq, stage.z, stage.u, vertcat(stage.p, stage.v), stage.t0, stage.T], [expr])
+        N, M = method.N, method.M
+        poly_coeff, poly_coeff_q, poly_coeff_z = method.poly_coeff, method.poly_coeff_q, method.poly_coeff_z
+        xqk, U = method.xqk, method.U
+
+        time = method.control_grid
+
+        # Fine time grid in one go: segment start times plus scaled offsets within each segment
+        if (M, refine) not in _FINE_GRID_CONSTANTS:
+            _FINE_GRID_CONSTANTS[(M, refine)] = (DM(range(M)), linspace(DM(0), DM(1), refine + 1))
+        steps, tau = _FINE_GRID_CONSTANTS[(M, refine)]
+        time_col = vec(time)
+        dt_all = (time_col[1:]-time_col[:-1])/M
+        seg_t0 = vec(repmat(time_col[:-1].T, M, 1) + mtimes(steps, dt_all.T))
+        seg_dt = vec(repmat(dt_all.T, M, 1))
+        fine_time = vec(repmat(seg_t0.T, refine, 1) + mtimes(tau[:-1], seg_dt.T))
+
+        if not stage.is_signal(expr) and not depends_on(expr, stage.xq):
+            # Constant over the grid: evaluate once
+            return vertcat(fine_time, time[-1]), repmat(method.eval_at_control(stage, expr, 0), 1, N*M*refine+1)
+
+        # Number of polynomial coefficients of states, quadratures and algebraic states
+        widths = set()
+        if poly_coeff: widths.add(poly_coeff[0].shape[1])
+        if poly_coeff_q: widths.add(poly_coeff_q[0].shape[1]+1)
+        if poly_coeff_z: widths.add(poly_coeff_z[0].shape[1])
+        s_max = max(widths, default=1)
+        # Powers of the local time are the constant powers of tau, scaled per interval by powers of dt
+        tau_pow = DM(np.vander(np.array(tau[:-1]).ravel(), s_max, increasing=True).T)
+
+        expr_f = Function('expr', [stage.t, stage.x, stage.xq, stage.z, stage.u, stage._pv, stage.t0, stage.T], [expr])
         assert not expr_f.has_free(), str(expr_f.free_mx())
-
+        # One mapped Function shared by all intervals, each evaluating refine points
+        expr_f_map = expr_f.map(refine)
 
         # Handle Bspline signals
         subgrid = list(np.linspace(0, 1, M*refine+1))[:-1]
 
         v_sampled_store = []
-        for e in stage._method.signals.values():
+        for e in method.signals.values():
             v_sampled = ca.horzsplit(e.sample(subgrid=subgrid,include_edges=False), refine)
             v_sampled_store.append(v_sampled)
         
         signals_sampled = []
         for i in range(M*N):
-            if stage._method.signals:
+            if method.signals:
                 signals_sampled.append(ca.vertcat(*[e[i] for e in v_sampled_store]))
             else:
                 signals_sampled.append(ca.DM(0,refine))
 
-        time = stage._method.control_grid
-        total_time = []
+        tau_inner = tau[:-1]
+
         sub_expr = []
         count_blocks = 0
         q_start = 0
         for k in range(N):
             t0 = time[k]
             dt = (time[k+1]-time[k])/M
-            tlocal = linspace(MX(0), dt, refine + 1)
-            assert tlocal.is_column()
-            ts = tlocal[:-1,:]
+            ts = tau_inner*dt
+            dt_pow = [MX(1)]
+            for i in range(1, s_max):
+                dt_pow.append(dt_pow[-1]*dt)
+            dt_pow = vcat(dt_pow)
+            tpower = tau_pow*repmat(dt_pow, 1, refine)
+            tpowers = {w: tpower if w==s_max else tpower[:w,:] for w in widths}
             for l in range(M):
-                local_t = t0+tlocal[:-1]
-                total_time.append(local_t)
-                coeff = None if stage._method.poly_coeff is None else stage._method.poly_coeff[k * M + l]
-                coeff_q = None if stage._method.poly_coeff_q is None else horzcat(stage._method.xqk[k * M + l], stage._method.poly_coeff_q[k * M + l])
-                either_coeff = coeff_q if coeff is None else coeff
-                tpower = None if either_coeff is None else hcat([constpow(ts,i) for i in range(either_coeff.shape[1])]).T
-                if stage._method.poly_coeff_z:
-                    coeff_z = stage._method.poly_coeff_z[k * M + l]
-                    tpower_z = hcat([constpow(ts,i) for i in range(coeff_z.shape[1])]).T
-                    z = mtimes(coeff_z,tpower_z)
-                else:
-                    z = nan
-
-                pv = stage._method.get_p_sys(stage,k,include_signals=False)
-                if stage._method.signals:
+                kl = k * M + l
+                local_t = t0+ts
+                coeff = None if poly_coeff is None else poly_coeff[kl]
+                coeff_q = None if poly_coeff_q is None else horzcat(xqk[kl], poly_coeff_q[kl])
+                coeff_z = poly_coeff_z[kl] if poly_coeff_z else None
+                x, xq, z = self._poly_or_nan([coeff, coeff_q, coeff_z], tpowers)
+
+                pv = method.get_p_sys(stage,k,include_signals=False)
+                if method.signals:
                     pv = ca.vertcat(ca.repmat(pv,1,refine),signals_sampled[count_blocks])
-                sub_expr.append(stage._method.eval_at_integrator(stage, expr_f(local_t.T, nan if coeff is None else mtimes(coeff,tpower), nan if coeff_q is None else mtimes(coeff_q,tpower), z, stage._method.U[k], pv, stage._method.t0, stage._method.T), k, l))
+                sub_expr.append(method.eval_at_integrator(stage, expr_f_map(local_t.T, x, xq, z, U[k], pv, method.t0, method.T), k, l))
                 t0+=dt
                 count_blocks+=1
-            q_start += stage._method.xqk[k]
-
-        ts = tlocal[-1,:]
-        total_time.append(time[k+1])
-        either_coeff = coeff_q if coeff is None else coeff
-        tpower = None if either_coeff is None else hcat([constpow(ts,i) for i in range(either_coeff.shape[1])]).T
-        if stage._method.poly_coeff_z:
-            tpower_z = hcat([constpow(ts,i) for i in range(coeff_z.shape[1])]).T
-            z = mtimes(coeff_z,tpower_z)
-        else:
-            z = nan
+            q_start += xqk[k]
+
+        coeff = None if coeff is None else poly_coeff[-1]
+        coeff_q = None if coeff_q is None else horzcat(xqk[-2],poly_coeff_q[-1])
+        x, xq, z = self._poly_or_nan([coeff, coeff_q, coeff_z], {w: dt_pow[:w] for w in widths})
+
+        pv = method.get_p_sys(stage,-1)
+        sub_expr.append(method.eval_at_integrator(stage, expr_f(time[k+1], x, xq, z, U[-1], pv, method.t0, method.T), k, l))
+
+        return vertcat(fine_time, time[-1]), hcat(sub_expr)
+
+    @staticmethod
+    def _poly_or_nan(coeffs, tpowers):
+        """Evaluate the given coefficient matrices against time powers; None entries yield nan
 
-        pv = stage._method.get_p_sys(stage,-1)
-        sub_expr.append(stage._method.eval_at_integrator(stage, expr_f(time[k+1], nan if coeff is None else mtimes(stage._method.poly_coeff[-1],tpower), nan if coeff_q is None else mtimes(horzcat(stage._method.xqk[-2],stage._method.poly_coeff_q[-1]),tpower), z, stage._method.U[-1], pv, stage._method.t0, stage._method.T), k, l))
+        tpowers maps a number of coefficients s to the matrix of powers 0..s-1 (one row each)
+        """
+        return [nan if c is None else mtimes(c, tpowers[c.shape[1]]) for c in coeffs]
 
-        return vcat(total_time), hcat(sub_expr)
+    @staticmethod
+    def _horner_or_nan(coeffs, t):
+        """Evaluate the given coefficient matrices at t in one Horner chain; None entries yield nan"""
+        values = iter(horner_stacked([c for c in coeffs if c is not None], t))
+        return [nan if c is None else next(values) for c in coeffs]
 
     @transcribed
     def value(self, expr):
@@ -1696,7 +1900,7 @@ class Stage:
         return self._method.discrete_system(self)
 
     @transcribed
-    def sampler(self, *args):
+    def sampler(self, *args, jit=False, parallelization='serial'):
         """Returns a function that samples given expressions
 
 
@@ -1712,6 +1916,16 @@ class Stage:
             Name for CasADi Function
         options : dict, optional
             Options for CasADi Function
+        jit : bool, optional
+            Just-in-time compile the sampling Function (requires a C compiler).
+            Compiled libraries are kept in ~/.cache/rockit (or $ROCKIT_CACHE) and reused.
+            Compiler flags may be passed as options['jit_options']['flags'];
+            other jit_options and the compiler option are not supported and raise an error.
+            Default: False
+        parallelization : str, optional
+            Parallelization of the Python Function over time-points: 'serial', 'openmp' or 'thread'
+            Ignored for mode 2; use :meth:`casadi.Function.map` on the result instead.
+            Default: 'serial'
 
         Returns
         -------
@@ -1740,44 +1954,83 @@ class Stage:
         t = MX.sym('t')
 
         """Evaluate expression at extra fine integrator discretization points."""
-        if self._method.poly_coeff is None:
-            msg = "No polynomal coefficients for the {} integration method".format(self._method.intg)
+        method = self._method
+        if method.poly_coeff is None:
+            msg = "No polynomal coefficients for the {} integration method".format(method.intg)
             raise Exception(msg)
-        N, M = self._method.N, self._method.M
-
-        expr_f = Function('expr', [self.t, self.x, self.z, self.u], exprs)
-        assert not expr_f.has_free()
-
-        time = vcat(self._method.integrator_grid)
-        k = low(self._method.control_grid, t)        
+        N, M = method.N, method.M
+
+        # Expression-independent data, rebuilt only when the method was transcribed anew
+        cache = method._sampler_cache
+        key = (id(method.poly_coeff), len(method.poly_coeff), id(method.U), len(method.U))
+        if cache.get('key') != key:
+            # Shapes are validated here, once per transcription, rather than on every sampler() call
+            assert len(set(c.shape for c in method.poly_coeff))==1
+            # One column per integrator interval: column-major vec of its (n_x, s) block
+            n_x, s = method.poly_coeff[0].shape
+            coeffs = reshape(hcat(method.poly_coeff), n_x*s, len(method.poly_coeff))
+            coeffs_z, s_z = None, None
+            if method.poly_coeff_z:
+                assert len(set(c.shape for c in method.poly_coeff_z))==1
+                n_z, s_z = method.poly_coeff_z[0].shape
+                coeffs_z = reshape(hcat(method.poly_coeff_z), n_z*s_z, len(method.poly_coeff_z))
+            cache.clear()
+            cache['key'] = key
+            # Keep the keyed lists alive so their ids cannot be reused
+            cache['pinned'] = (method.poly_coeff, method.U)
+            cache['bundle'] = (method.integrator_grid_vec, coeffs, s, coeffs_z, s_z, hcat(method.U))
+        time, coeffs, s, coeffs_z, s_z, Us = cache['bundle']
+
+        # expr_f per symbols/expressions, least recently used first;
+        # the expressions are stored alongside, keeping their hashes unique
+        expr_cache = cache.setdefault('exprs', OrderedDict())
+        expr_args = [self.t, self.x, self.z, self.u]
+        expr_key = None
+        if all(isinstance(e, MX) for e in exprs):
+            expr_key = tuple(hash(e) for e in expr_args + exprs)
+        if expr_key in expr_cache:
+            expr_f = expr_cache[expr_key][1]
+            expr_cache.move_to_end(expr_key)
+        else:
+            expr_f = Function('expr', expr_args, exprs)
+            assert not expr_f.has_free()
+            # Scalar SX graphs evaluate (and jit) faster; not possible for e.g. embedded integrators
+            try:
+                expr_f = expr_f.expand()
+            except Exception:
+                pass
+            if expr_key is not None:
+                expr_cache[expr_key] = (expr_args + exprs, expr_f)
+                # Bounded: e.g. an MPC loop may sample a fresh expression at every iteration
+                if len(expr_cache)>_SAMPLER_EXPR_CACHE_SIZE:
+                    expr_cache.popitem(last=False)
+
+        k = low(method.control_grid, t)
         i = low(time, t)
         ti = time[i]
         tlocal = t-ti
 
-        for c in self._method.poly_coeff:
-            assert c.shape == self._method.poly_coeff[0].shape
-
-        coeffs = hcat(self._method.poly_coeff)
-        s = self._method.poly_coeff[0].shape[1]
-        coeff = coeffs[:,(i*s+DM(range(s)).T)]
-
-        tpower = constpow(tlocal,range(s))
-        if self._method.poly_coeff_z:
-            for c in self._method.poly_coeff_z:
-                assert c.shape == self._method.poly_coeff_z[0].shape
-            coeffs_z = hcat(self._method.poly_coeff_z)
-            s_z = self._method.poly_coeff_z[0].shape[1]
-            coeff_z = coeffs_z[:,i*s_z+DM(range(s_z)).T]
-            tpower_z = constpow(tlocal,range(s_z))
-            z = mtimes(coeff_z,tpower_z)
-        else:
-            z = nan
-
-        Us = hcat(self._method.U)
-        f = Function(name,[self.gist, t],expr_f.call([t, mtimes(coeff,tpower), z, Us[:,k]]), options)
+        coeff = reshape(coeffs[:,i], coeffs.shape[0]//s, s)
+        coeff_z = None if coeffs_z is None else reshape(coeffs_z[:,i], coeffs_z.shape[0]//s_z, s_z)
+        x, z = self._horner_or_nan([coeff, coeff_z], tlocal)
+
+        if jit:
+            jit_options = options.get("jit_options", {})
+            unsupported = [k for k in jit_options if k!="flags"] + (["compiler"] if "compiler" in options else [])
+            if unsupported:
+                raise Exception("sampler with jit=True only supports jit_options 'flags', got unsupported: " + ", ".join(unsupported))
+            options = {k: v for k, v in options.items() if k not in ("jit", "compiler", "jit_options")}
+        f = Function(name,[self.gist, t],expr_f.call([t, x, z, Us[:,k]]), options)
         assert not f.has_free()
+        if jit:
+            f = jit_cached(f, jit_options.get("flags", _SAMPLER_JIT_FLAGS))
 
         if numpy:
+            sizes = [expr_f.size_out(i) for i in range(expr_f.n_out())]
+            # Dense in- and outputs can be evaluated straight from and into numpy arrays
+            buffered = f.sparsity_in(0).is_dense() and all(f.sparsity_out(i).is_dense() for i in range(f.n_out()))
+            # Mapped sampling Functions (with gist shared by all time-points) and their buffers, per number of time-points
+            f_maps = {}
             def wrapper(gist, t):
                 """
                 Parameters
@@ -1793,14 +2046,33 @@ class Stage:
                 :obj:`np.array`
 
                 """
-                tdim = None if isinstance(t, float) or isinstance(t, int) or len(t.shape)==0 else DM(t).numel()
-                t = DM(t)
-                if t.is_column(): t = t.T
-                res = f.call([gist, t])
+                if isinstance(t, float) or isinstance(t, int) or len(t.shape)==0:
+                    tdim = None
+                    res = f.call([gist, t])
+                else:
+                    t = np.ascontiguousarray(np.asarray(t, dtype=float).reshape(-1))
+                    tdim = t.size
+                    if tdim not in f_maps:
+                        f_map = f.map(name + "_map", parallelization, tdim, [0], [])
+                        f_maps[tdim] = (f_map,) + tuple(f_map.buffer())
+                    f_map, buf, f_eval = f_maps[tdim]
+                    gist_flat = np.ascontiguousarray(np.asarray(gist, dtype=float).reshape(-1))
+                    # Other gist sizes go through Function.call, which checks (and broadcasts) dimensions
+                    if buffered and gist_flat.size==f.nnz_in(0):
+                        buf.set_arg(0, memoryview(gist_flat))
+                        buf.set_arg(1, memoryview(t))
+                        res = []
+                        for i, size in enumerate(sizes):
+                            r = np.empty(size[0]*size[1]*tdim)
+                            buf.set_res(i, memoryview(r))
+                            res.append(r.reshape((size[0], size[1]*tdim), order='F'))
+                        f_eval()
+                    else:
+                        res = f_map.call([gist, t.reshape(1, -1)])
                 if ret_list:
-                    return [DM2numpy(r, expr_f.size_out(i), tdim) for i,r in enumerate(res)]
+                    return [DM2numpy(r, sizes[i], tdim) for i,r in enumerate(res)]
                 else:
-                    return DM2numpy(res[0], expr_f.size_out(0), tdim)
+                    return DM2numpy(res[0], sizes[0], tdim)
             return wrapper
         else:
             return f
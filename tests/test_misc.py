@@ -879,6 +879,25 @@ class MiscTests(unittest.TestCase):
 
         print(f(1,1,2,3))
 
+    def test_to_function_integrator(self):
+        ocp = Ocp(T=1)
+        x = ocp.state()
+        u = ocp.control()
+        ocp.set_der(x, u)
+        ocp.subject_to(-1 <= (u <= 1))
+        ocp.subject_to(ocp.at_t0(x) == 0)
+        ocp.add_objective(-ocp.at_tf(x))
+        ocp.solver('ipopt')
+        ocp.method(DirectCollocation(N=4,M=2))
+
+        # Integrator samples of a collocation method are the decision variables themselves
+        _, xs = ocp.sample(x, grid='integrator')
+        f = ocp.to_function('f', [xs], [ocp.sample(x, grid='control')[1]])
+        assert_array_almost_equal(np.array(f(np.linspace(0, 1, 9))).squeeze(), np.linspace(0, 1, 5))
+
+        sol = ocp.solve()
+        assert_array_almost_equal(sol.sample(x, grid='integrator')[1], np.linspace(0, 1, 9))
+
     def test_to_function_init(self):
         N = 10
         method = DirectCollocation(N=N,M=2,scheme="legendre")
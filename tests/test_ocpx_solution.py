@@ -1,9 +1,14 @@
+import os
+import shutil
+import tempfile
 import unittest
+from unittest import mock
 import numpy as np
 from numpy.testing import assert_allclose
 from problems import integrator_control_problem, bang_bang_problem
 from casadi import vertcat, DM, hcat
 from rockit import MultipleShooting, DirectCollocation, Ocp, SingleShooting, SplineMethod
+from rockit.stage import _SAMPLER_EXPR_CACHE_SIZE
 
 class OcpSolutionTests(unittest.TestCase):
     def test_grid_integrator(self):
@@ -125,5 +130,59 @@ class OcpSolutionTests(unittest.TestCase):
           assert_allclose(sampler_numpy2_sol(t), X)
           assert_allclose(sampler_numpy1_sol(t)[0], X)
 
+    def test_sample_constant(self):
+        ocp, x, u = integrator_control_problem(10, 2, 1, MultipleShooting(N=10,M=3,intg='rk'))
+        p = ocp.parameter()
+        ocp.set_value(p, 3)
+        sol = ocp.solve()
+        for kwargs, tdim in [(dict(grid='integrator'), 31), (dict(grid='integrator', refine=2), 61)]:
+            ts, ps = sol.sample(2*p, **kwargs)
+            ts_ref, _ = sol.sample(x, **kwargs)
+            assert_allclose(ts, ts_ref)
+            assert_allclose(ps, 6*np.ones(tdim))
+
+    @unittest.skipIf(shutil.which(os.environ.get("CC", "gcc")) is None, "no C compiler found")
+    def test_sampler_jit(self):
+        ocp, x, u = integrator_control_problem(10, 2, 1, MultipleShooting(N=10,M=3,intg='rk'))
+        sol = ocp.solve()
+        ts = np.linspace(0, 10, 17)
+        s = sol.sampler([x, u])
+        with tempfile.TemporaryDirectory() as cache, mock.patch.dict(os.environ, {"ROCKIT_CACHE": cache}):
+            s_jit = sol.sampler([x, u], jit=True)
+            for r, r_jit in zip(s(ts), s_jit(ts)):
+                assert_allclose(r, r_jit)
+            # Only the shared library is left behind
+            self.assertEqual(len(os.listdir(cache)), 1)
+        with self.assertRaises(Exception):
+            ocp.sampler('s', [x, u], {"jit_options": {"verbose": True}}, jit=True)
+
+    def test_sampler_cache_bounded(self):
+        ocp, x, u = integrator_control_problem(10, 2, 1, MultipleShooting(N=10,M=3,intg='rk'))
+        sol = ocp.solve()
+        # E.g. an MPC loop sampling a fresh expression at every iteration
+        for i in range(3*_SAMPLER_EXPR_CACHE_SIZE):
+            s = sol.sampler(x**2+i*u)
+            assert_allclose(s(2.0), sol.sampler(x)(2.0)**2+i*sol.sampler(u)(2.0))
+        self.assertLessEqual(len(ocp._method._sampler_cache['exprs']), _SAMPLER_EXPR_CACHE_SIZE)
+
+    def test_sampler_gist_mismatch(self):
+        ocp, x, u = integrator_control_problem(10, 2, 1, MultipleShooting(N=10,M=3,intg='rk'))
+        sol = ocp.solve()
+        s = ocp.sampler([x, u])
+        ts = np.linspace(0, 10, 3)
+        for gist in [np.zeros(1000), sol.gist[:-1]]:
+            with self.assertRaisesRegex(RuntimeError, "mismatching shape"):
+                s(gist, ts)
+
+    def test_sampler_parallelization(self):
+        ocp, x, u = integrator_control_problem(10, 2, 1, MultipleShooting(N=10,M=3,intg='rk'))
+        sol = ocp.solve()
+        ts = np.linspace(0, 10, 17)
+        s = sol.sampler([x, u])
+        s_thread = sol.sampler([x, u], parallelization='thread')
+        for r, r_thread in zip(s(ts), s_thread(ts)):
+            assert_allclose(r, r_thread)
+        assert_allclose(s(ts[3])[0], s_thread(ts[3])[0])
+
 if __name__ == '__main__':
     unittest.main()
@@ -283,5 +283,54 @@ class StageTests(unittest.TestCase):
                         ts, us = sol(mystage).sample(u, grid='integrator', refine=10)
                         np.testing.assert_allclose(us, u_ref, atol=tolerance)
 
+    def test_symbol_cache(self):
+      ocp = Ocp(T=10)
+
+      x = ocp.state()
+      self.assertEqual(ocp.nx, 1)
+      self.assertEqual(ocp.nu, 0)
+      y = ocp.state(2)
+      u = ocp.control()
+      self.assertEqual(ocp.nx, 3)
+      self.assertEqual(ocp.nu, 1)
+      p = ocp.parameter()
+      self.assertEqual(ocp.np, 1)
+
+      stage = ocp.stage(ocp)
+      self.assertEqual(stage.nx, 3)
+      stage.state()
+      self.assertEqual(stage.nx, 4)
+      self.assertEqual(ocp.nx, 3)
+
+    def test_bulk(self):
+      ocp = Ocp(T=1)
+      x = ocp.state()
+      u = ocp.control()
+      ocp.set_der(x, u)
+      ocp.subject_to(-1 <= (u <= 1))
+      ocp.subject_to(ocp.at_t0(x) == 0)
+      ocp.add_objective(-ocp.at_tf(x))
+      ocp.solver('ipopt')
+      ocp.method(MultipleShooting(N=4))
+      self.assertEqual(ocp.nx, 1)
+
+      with ocp.bulk():
+        ys = [ocp.state() for i in range(3)]
+        for y in ys:
+          ocp.set_der(y, x)
+          ocp.subject_to(ocp.at_t0(y) == 0)
+        self.assertEqual(ocp.nx, 4)
+      self.assertFalse(ocp.is_transcribed)
+
+      sol = ocp.solve()
+      self.assertAlmostEqual(sol.value(ocp.at_tf(x)), 1, places=6)
+      self.assertAlmostEqual(sol.value(ocp.at_tf(ys[0])), 0.5, places=6)
+
+    def test_parse_grid(self):
+      self.assertEqual(Stage._parse_grid('control'), ('control', True, True))
+      self.assertEqual(Stage._parse_grid('control-'), ('control', True, False))
+      self.assertEqual(Stage._parse_grid('-control'), ('control', False, True))
+      self.assertEqual(Stage._parse_grid('-foo-'), ('foo', False, False))
+
 if __name__ == '__main__':
     unittest.main()